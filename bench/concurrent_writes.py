@@ -0,0 +1,104 @@
+"""
+Stress the write path with many concurrent writer processes.
+
+Each process saves new posts sharing a hot tag, and after each one bumps two
+shared counters with a read-modify-write, one in write_transaction and one by a
+plain Post.save(). Lost updates show up as a counter lower than the number of
+committed bumps. The plain counter is expected to lose, the other must not.
+Exits with 1 if the write_transaction counter loses or any write fails.
+
+Run from the repository root: `python bench/concurrent_writes.py [-p N] [-n N]`
+A throwaway instance is created unless WHISPER_INSTANCE is set, see instance.py.
+"""
+import sys
+import time
+import argparse
+import multiprocessing
+
+import instance  # noqa: F401  # pylint: disable=unused-import
+from whisper.core import app, Post, get_post, write_transaction
+
+
+def bump(slug: str = 'bench-counter') -> None:
+    """Increase a shared counter by one"""
+    post = get_post(slug, True)
+    assert post is not None
+    meta = post.meta
+    meta['n'] = str(int(meta['n']) + 1)
+    post.meta = meta
+    post.save()
+
+
+def worker(index: int, saves: int, queue: 'multiprocessing.Queue[dict]') -> None:
+    """Save posts and bump counter, report committed writes and errors"""
+    result = {'posts': 0, 'bumps': 0, 'plain': 0, 'errors': {}}
+    with app.app_context():
+        for i in range(saves):
+            try:
+                post = Post(f'bench-{index}-{i}', public=True, indexed=True)
+                post.tag = ['bench', f'bench-{index}']
+                post.save()
+                result['posts'] += 1
+                write_transaction(bump)
+                result['bumps'] += 1
+                bump('bench-plain')
+                result['plain'] += 1
+            except Exception as e:  # pylint: disable=broad-except
+                result['errors'][str(e)] = result['errors'].get(str(e), 0) + 1
+    queue.put(result)
+
+
+def main() -> None:
+    """Run writers in parallel and print the summary"""
+    # pylint: disable=too-many-locals
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-p', '--processes', type=int, default=16)
+    parser.add_argument('-n', '--saves', type=int, default=40)
+    args = parser.parse_args()
+
+    with app.app_context():
+        for slug in ('bench-counter', 'bench-plain'):
+            counter = Post(slug)
+            counter.meta = {'n': '0'}
+            counter.save()
+
+    queue: 'multiprocessing.Queue[dict]' = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=worker, args=(i, args.saves, queue))
+        for i in range(args.processes)
+    ]
+    start = time.time()
+    for proc in procs:
+        proc.start()
+    results = [queue.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    elapsed = time.time() - start
+
+    posts = sum(r['posts'] for r in results)
+    bumps = sum(r['bumps'] for r in results)
+    plain = sum(r['plain'] for r in results)
+    errors: dict[str, int] = {}
+    for r in results:
+        for msg, num in r['errors'].items():
+            errors[msg] = errors.get(msg, 0) + num
+    with app.app_context():
+        values = []
+        for slug in ('bench-counter', 'bench-plain'):
+            post = get_post(slug, True)
+            assert post is not None
+            values.append(int(post.meta['n']))
+    print(f'{args.processes} writers x {args.saves} saves in {elapsed:.2f}s')
+    print(f'transactions: {(posts + bumps + plain) / elapsed:.0f}/s')
+    print(f'posts saved: {posts}/{args.processes * args.saves}')
+    print(f'write_transaction counter: {values[0]}, committed bumps: {bumps},'
+          f' lost: {bumps - values[0]}')
+    print(f'plain save counter: {values[1]}, committed bumps: {plain},'
+          f' lost: {plain - values[1]}')
+    print(f'errors: {errors or 0}')
+    if bumps != values[0] or errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
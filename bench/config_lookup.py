@@ -0,0 +1,29 @@
+"""
+Benchmark option lookups on Config against its frozen FrozenConfig.
+
+Run from the repository root: `python bench/config_lookup.py [-n NUMBER]`
+A throwaway instance is created unless WHISPER_INSTANCE is set, see instance.py.
+"""
+import timeit
+import argparse
+
+import instance  # noqa: F401  # pylint: disable=unused-import
+from whisper.core import Config, freeze
+
+
+def main() -> None:
+    """Time hit and miss lookups of a three level option"""
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-n', '--number', type=int, default=1000000)
+    args = parser.parse_args()
+
+    config = Config()
+    config.a.b.c = 1
+    for name, stmt in (('hit', 'c.a.b.c'), ('miss', 'c.a.x.y')):
+        for kind, obj in (('Config', config), ('FrozenConfig', freeze(config))):
+            seconds = timeit.timeit(stmt, globals={'c': obj}, number=args.number)
+            print(f'{name:4} {stmt} {kind:13} {seconds / args.number * 1e9:8.0f} ns')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+"""
+Prepare import path and a throwaway instance for benchmark scripts.
+
+Import this before `whisper.core`. The instance is created in a temporary
+directory unless WHISPER_INSTANCE is set.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+if 'WHISPER_INSTANCE' not in os.environ:
+    os.environ['WHISPER_INSTANCE'] = tempfile.mkdtemp(prefix='whisper-bench-')
+    with open(
+        os.path.join(os.environ['WHISPER_INSTANCE'], 'config.py'),
+        'w',
+        encoding='utf-8',
+    ) as f:
+        f.write('from whisper.core import load\nload(\'core\')\n')
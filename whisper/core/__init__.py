@@ -18,13 +18,16 @@ from werkzeug.routing import BaseConverter
 current_app: 'WhisperFlask' = flask_current_app # type: ignore
 
 # pylint: disable=cyclic-import
-from . import db, post, confmgr, eventmgr, provider, dispatcher
+from . import db, post, confmgr, eventmgr, provider, dispatcher, feed, \
+              related
 from .db import *
 from .post import *
 from .confmgr import *
 from .eventmgr import *
 from .provider import *
 from .dispatcher import *
+from .feed import *
+from .related import *
 # autopep8: on
 
 __all__ = (['WhisperFlask', 'SlugConverter', 'current_app', 'app']
@@ -34,6 +37,8 @@ __all__ = (['WhisperFlask', 'SlugConverter', 'current_app', 'app']
            + eventmgr.__all__
            + provider.__all__
            + dispatcher.__all__
+           + feed.__all__
+           + related.__all__
            )
 
 
@@ -70,7 +75,7 @@ class WhisperFlask(Flask):
         self.url_map.converters['slug'] = WhisperFlask.SlugConverter
         self.jinja_options['autoescape'] = False  # be careful
         # app global objects
-        self.c = Config()
+        self.c: t.Union[Config, FrozenConfig] = Config()
         self.e = EventManager()
         self.p: dict[str, BaseProvider] = {}
         self.main: MainProvider = StubProvider()  # load later
@@ -123,6 +128,10 @@ with app.app_context():
             f'MainProvider not found at `{app.c.core.main}.config.provider`'
         )
 
+    # prepare related posts index
+    related.init_related()
+
     # finished starting
     app.e('core:loaded')
+    app.c = freeze(app.c)
     current_app.logger.warn('whisper started')
@@ -1,11 +1,19 @@
 """
 This module is run by `python -m whisper.core` command, and starts a development
-WSGI server built in Flask.
+WSGI server built in Flask, or runs a Flask command if given, for example
+`python -m whisper.core rebuild-related`.
 """
 import os
+import sys
+from flask.cli import ScriptInfo
 from . import app
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        app.cli.main(
+            prog_name='python -m whisper.core',
+            obj=ScriptInfo(create_app=lambda: app),
+        )
     os.environ.setdefault('FLASK_ENV', 'development')
     app.config.update({
         'USE_X_SENDFILE': False,
@@ -17,7 +17,33 @@ app.c.core.main = 'core'
 # the title of this website
 app.c.core.title = 'Whisper'
 
+# the description of this website, used in feeds
+app.c.core.description = ''
+
 # the icon of this website
 app.c.core.icon = ''
 # Example:
 # app.c.core.icon = '/static/logo.png'
+
+# the number of latest posts in RSS/Atom feeds
+app.c.core.feed_size = 20
+
+# seconds for clients to cache feeds and sitemaps before revalidating
+app.c.core.feed_max_age = 3600
+
+# the number of related posts kept for each post
+app.c.core.related_size = 10
+
+# seconds of creation time gap that halves the relevance of related posts
+# the index is updated on changes while tag weights drift, rebuild it
+# periodically or after changing these options, by either of the commands:
+# flask --app whisper.core rebuild-related
+# python -m whisper.core rebuild-related
+app.c.core.related_half_life = 365 * 24 * 3600
+
+# times to retry a write when the database is locked by another worker
+app.c.core.write_retries = 6
+
+# seconds to wait for the lock in the first attempt, doubled on each retry
+# with the defaults a writer gives up after about 10 seconds
+app.c.core.write_backoff = 0.05
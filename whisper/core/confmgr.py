@@ -3,11 +3,12 @@ This module provides tools for configuration management.
 """
 import typing as t
 import importlib
+from types import MappingProxyType
 
 from . import current_app
 from .provider import BaseProvider
 
-__all__ = ['Config', 'load', 'require']
+__all__ = ['Config', 'FrozenConfig', 'MISSING', 'freeze', 'load', 'require']
 
 
 class Config:
@@ -48,6 +49,71 @@ class Config:
         self[key] = value
 
 
+def _freeze_value(value: t.Any) -> t.Any:
+    """Return read-only copy of option value, containers converted deeply"""
+    if isinstance(value, Config):
+        return freeze(value)
+    if isinstance(value, dict):
+        return MappingProxyType({
+            key: _freeze_value(item) for key, item in value.items()
+        })
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze_value(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+class FrozenConfig:
+    """Read-only Config with options stored as plain instance attributes"""
+
+    def __init__(self, config: t.Optional[dict[str, t.Any]] = None) -> None:
+        """Construct from dict, freeze nesting Config, list, dict and set"""
+        for key, value in (config or {}).items():
+            self.__dict__[key] = _freeze_value(value)
+
+    def __contains__(self, key: str) -> bool:
+        """Check option existence"""
+        return key in self.__dict__
+
+    def __len__(self) -> int:
+        """Return the number of sections or options"""
+        return len(self.__dict__)
+
+    def __getitem__(self, key: str) -> t.Any:
+        """Returns value if option exists, defaults to MISSING"""
+        return self.__dict__.get(key, MISSING)
+
+    def __setitem__(self, key: str, value: t.Any) -> t.NoReturn:
+        """Refuse to change option"""
+        raise TypeError(f'config is frozen, cannot set `{key}`')
+
+    def __getattr__(self, key: str) -> t.Any:
+        """Only called for missing options, returns MISSING"""
+        if key.startswith('__'):
+            raise AttributeError(key)
+        return MISSING
+
+    def __setattr__(self, key: str, value: t.Any) -> t.NoReturn:
+        """Refuse to change option"""
+        raise TypeError(f'config is frozen, cannot set `{key}`')
+
+    def __delattr__(self, key: str) -> t.NoReturn:
+        """Refuse to remove option"""
+        raise TypeError(f'config is frozen, cannot delete `{key}`')
+
+
+# empty and falsy, returned by every missing option lookup on FrozenConfig
+MISSING = FrozenConfig()
+
+
+def freeze(config: t.Union[Config, FrozenConfig]) -> FrozenConfig:
+    """Compile config into a read-only copy for fast lookups"""
+    if isinstance(config, FrozenConfig):
+        return config
+    return FrozenConfig(config._config)  # pylint: disable=protected-access
+
+
 def load(plugin: str) -> None:
     """Loads specific plugin and its default config, and register provider"""
     current_app.logger.info(f'Loading {plugin}')
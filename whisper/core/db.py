@@ -18,6 +18,8 @@ def get_db() -> sqlite3.Connection:
         g.db = sqlite3.connect(current_app.instance_resource('whisper.db'))
         g.db.row_factory = sqlite3.Row
         g.db.execute('PRAGMA foreign_keys = ON')
+        # safe in WAL mode, only the last commits may be lost on power failure
+        g.db.execute('PRAGMA synchronous = NORMAL')
         current_app.e('core:db_connect')
     return g.db
 
@@ -44,3 +46,19 @@ def init_db() -> None:
             encoding='utf-8',
         ) as f:
             current_app.db.executescript(f.read())
+    # upgrade databases created by older versions
+    current_app.db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_listing'
+        ' ON post(public, indexed, creation, slug, modified)'
+    )
+    current_app.db.execute(
+        'CREATE TABLE IF NOT EXISTS revision'
+        ' (rev INTEGER NOT NULL, changed INTEGER NOT NULL)'
+    )
+    current_app.db.execute(
+        "INSERT INTO revision (rev, changed) SELECT 0, strftime('%s')"
+        ' WHERE NOT EXISTS (SELECT 1 FROM revision)'
+    )
+    current_app.db.commit()
+    # let readers of concurrent workers not block the writer
+    current_app.db.execute('PRAGMA journal_mode = WAL')
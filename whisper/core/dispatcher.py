@@ -13,7 +13,7 @@ from .provider import BaseProvider
 
 __all__ = ['template']
 
-bp = Blueprint('core', __name__)
+bp: Blueprint = Blueprint('core', __name__)
 
 
 @bp.app_context_processor
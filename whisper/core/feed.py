@@ -0,0 +1,183 @@
+"""
+This module serves RSS/Atom feeds and sharded sitemaps of public indexed posts.
+
+Documents are streamed straight from database cursor, and sent with validators
+derived from the revision of posts, which moves on every save and removal, so
+that unchanged ones cost one query.
+"""
+import typing as t
+import math
+import sqlite3
+from datetime import datetime, timezone
+from email.utils import formatdate
+from xml.sax.saxutils import escape, quoteattr
+from flask import Response, request, abort, url_for, stream_with_context
+from flask.typing import ResponseReturnValue
+
+from . import current_app
+from .dispatcher import bp
+from .post import iter_posts, stat_posts, stat_post_chunks, get_revision
+
+__all__ = ['SITEMAP_SHARD_SIZE']
+
+# maximum URLs in a single sitemap file, limited by the sitemap protocol
+SITEMAP_SHARD_SIZE = 50000
+
+FEED_COLUMNS = ('slug', 'creation', 'modified', 'title', 'excerpt')
+SITEMAP_COLUMNS = ('slug', 'modified')
+
+
+def _w3c_time(timestamp: int) -> str:
+    """Format timestamp as W3C datetime, used by Atom and sitemap"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def _xml_response(
+    body: t.Iterator[str],
+    rev: int,
+    changed: int,
+) -> ResponseReturnValue:
+    """Stream XML body with validators, never start it if not modified"""
+    resp = Response(stream_with_context(body), mimetype='application/xml')
+    resp.set_etag(f'r{rev}')
+    resp.last_modified = datetime.fromtimestamp(changed, timezone.utc)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = int(current_app.c.core.feed_max_age)
+    return resp.make_conditional(request)
+
+
+def _iter_feed() -> t.Iterator[sqlite3.Row]:
+    """Yield rows of posts in feeds"""
+    return iter_posts(
+        FEED_COLUMNS,
+        limit=int(current_app.c.core.feed_size),
+        indexed=True,
+        public=True,
+    )
+
+
+def _rss(changed: int) -> t.Iterator[str]:
+    """Generate RSS 2.0 document"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<rss version="2.0"><channel>'
+    yield f'<title>{escape(current_app.c.core.title)}</title>'
+    yield f'<link>{escape(url_for("core.index", _external=True))}</link>'
+    yield f'<description>{escape(current_app.c.core.description)}</description>'
+    yield f'<lastBuildDate>{formatdate(changed, usegmt=True)}</lastBuildDate>'
+    for row in _iter_feed():
+        link = escape(url_for('core.post', slug=row['slug'], _external=True))
+        yield (
+            '<item>'
+            f'<title>{escape(row["title"])}</title>'
+            f'<link>{link}</link>'
+            f'<guid isPermaLink="true">{link}</guid>'
+            f'<pubDate>{formatdate(row["creation"], usegmt=True)}</pubDate>'
+            f'<description>{escape(row["excerpt"])}</description>'
+            '</item>'
+        )
+    yield '</channel></rss>\n'
+
+
+def _atom(changed: int) -> t.Iterator[str]:
+    """Generate Atom document"""
+    index = url_for('core.index', _external=True)
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<feed xmlns="http://www.w3.org/2005/Atom">'
+    yield f'<title>{escape(current_app.c.core.title)}</title>'
+    yield f'<subtitle>{escape(current_app.c.core.description)}</subtitle>'
+    yield f'<id>{escape(index)}</id>'
+    yield f'<link href={quoteattr(index)}/>'
+    yield (
+        '<link rel="self" '
+        f'href={quoteattr(url_for("core.atom", _external=True))}/>'
+    )
+    yield f'<updated>{_w3c_time(changed)}</updated>'
+    yield f'<author><name>{escape(current_app.c.core.title)}</name></author>'
+    for row in _iter_feed():
+        link = url_for('core.post', slug=row['slug'], _external=True)
+        yield (
+            '<entry>'
+            f'<title>{escape(row["title"])}</title>'
+            f'<id>{escape(link)}</id>'
+            f'<link href={quoteattr(link)}/>'
+            f'<published>{_w3c_time(row["creation"])}</published>'
+            f'<updated>{_w3c_time(row["modified"])}</updated>'
+            f'<summary>{escape(row["excerpt"])}</summary>'
+            '</entry>'
+        )
+    yield '</feed>\n'
+
+
+def _sitemap_index() -> t.Iterator[str]:
+    """Generate sitemap index document pointing to every shard"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    shards = stat_post_chunks(
+        SITEMAP_SHARD_SIZE,
+        newest_first=False,
+        indexed=True,
+        public=True,
+    )
+    for shard, (_, newest) in enumerate(shards, 1):
+        link = url_for('core.sitemap_shard', shard=shard, _external=True)
+        yield (
+            '<sitemap>'
+            f'<loc>{escape(link)}</loc>'
+            f'<lastmod>{_w3c_time(newest)}</lastmod>'
+            '</sitemap>'
+        )
+    yield '</sitemapindex>\n'
+
+
+def _sitemap_shard(shard: int) -> t.Iterator[str]:
+    """Generate one sitemap shard document"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    for row in iter_posts(
+        SITEMAP_COLUMNS,
+        limit=SITEMAP_SHARD_SIZE,
+        offset=(shard-1)*SITEMAP_SHARD_SIZE,
+        newest_first=False,
+        indexed=True,
+        public=True,
+    ):
+        link = url_for('core.post', slug=row['slug'], _external=True)
+        yield (
+            '<url>'
+            f'<loc>{escape(link)}</loc>'
+            f'<lastmod>{_w3c_time(row["modified"])}</lastmod>'
+            '</url>'
+        )
+    yield '</urlset>\n'
+
+
+@bp.route('/feed.xml', endpoint='rss')
+def rss() -> ResponseReturnValue:
+    """Send RSS feed of latest public indexed posts"""
+    rev, changed = get_revision()
+    return _xml_response(_rss(changed), rev, changed)
+
+
+@bp.route('/atom.xml', endpoint='atom')
+def atom() -> ResponseReturnValue:
+    """Send Atom feed of latest public indexed posts"""
+    rev, changed = get_revision()
+    return _xml_response(_atom(changed), rev, changed)
+
+
+@bp.route('/sitemap.xml', endpoint='sitemap')
+def sitemap() -> ResponseReturnValue:
+    """Send sitemap index of all shards"""
+    rev, changed = get_revision()
+    return _xml_response(_sitemap_index(), rev, changed)
+
+
+@bp.route('/sitemap-<int:shard>.xml', endpoint='sitemap_shard')
+def sitemap_shard(shard: int) -> ResponseReturnValue:
+    """Send a sitemap shard, oldest posts first to keep shards stable"""
+    # shards past a removed post shift, so validate against all posts
+    rev, changed = get_revision()
+    count, _ = stat_posts(indexed=True, public=True)
+    if not 1 <= shard <= math.ceil(count / SITEMAP_SHARD_SIZE):
+        abort(404)
+    return _xml_response(_sitemap_shard(shard), rev, changed)
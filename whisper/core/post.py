@@ -1,6 +1,15 @@
 """
 This module defines Post class, and provides tool to get Post object by slug or
-list of Post objects by tag with pagination.
+list of Post objects by tag with pagination, or to stream selected columns of
+posts straight from database cursor.
+
+Writes go through write_transaction, which takes the write lock at BEGIN and
+retries with backoff while other workers hold it. As work may run more than
+once, side effects out of database (like file operations) should be deferred
+with after_commit, and in-memory changes undone with after_rollback. Nested
+writes join the running transaction. Read-modify-write, like get_post and save,
+must read inside the same write_transaction too, or concurrent updates are lost
+with the last writer winning.
 """
 import typing as t
 import os
@@ -8,10 +17,19 @@ import re
 import math
 import time
 import shutil
+import random
+import sqlite3
+import functools
+from flask import g
 
 from . import current_app
 
-__all__ = ['Post', 'get_post', 'get_posts']
+__all__ = ['Post', 'POST_COLUMNS', 'get_post', 'get_posts', 'iter_posts',
+           'stat_posts', 'stat_post_chunks', 'get_revision',
+           'write_transaction', 'after_commit', 'after_rollback']
+
+POST_COLUMNS = ('slug', 'provide', 'public', 'indexed', 'creation', 'modified',
+                'title', 'excerpt', 'content')
 
 
 class Post:
@@ -122,15 +140,40 @@ class Post:
             for file in files
         ]
 
+    def related(self) -> list['Post']:
+        """Return precomputed related public indexed posts, most related first"""
+        cur = current_app.db.execute(
+            'SELECT post.* FROM related'
+            ' JOIN post ON post.slug = related.related'
+            ' WHERE related.post = ?'
+            ' ORDER BY score DESC, related.related DESC',
+            (self._orig_slug,)
+        )
+        return [Post(**dict(row)) for row in cur]
+
     def save(self) -> None:
         """Save attributes into database, save new slug, tags and metadatas if necessary"""
+        write_transaction(self._save)
+
+    def _save(self) -> None:
+        """Write this post in a running transaction, may run more than once"""
+        after_rollback(functools.partial(
+            self._restore, self._orig_slug, self._orig_tag, self._orig_meta
+        ))
         current_app.e('core:save_post', {'post': self})
         self.provide = self.provide or 'main'
         if not self.creation:
             self.creation = int(time.time())
         self.modified = int(time.time())
+        _revise()
         current_app.db.execute(
-            'REPLACE INTO post VALUES (?,?,?,?,?,?,?,?,?)',
+            'INSERT INTO post VALUES (?,?,?,?,?,?,?,?,?)'
+            ' ON CONFLICT (slug) DO UPDATE SET'
+            ' (provide, public, indexed, creation, modified,'
+            ' title, excerpt, content) ='
+            ' (excluded.provide, excluded.public, excluded.indexed,'
+            ' excluded.creation, excluded.modified,'
+            ' excluded.title, excluded.excerpt, excluded.content)',
             (
                 self._orig_slug,
                 self.provide,
@@ -171,24 +214,124 @@ class Post:
                 'UPDATE post SET slug=? WHERE slug=?',
                 (self.slug, self._orig_slug)
             )
-            if os.path.isdir(current_app.instance_resource(self._orig_slug)):
-                os.rename(
-                    current_app.instance_resource(self._orig_slug),
-                    current_app.instance_resource(self.slug)
-                )
+            after_commit(functools.partial(
+                _move_files, self._orig_slug, self.slug
+            ))
             self._orig_slug = self.slug
-        current_app.db.commit()
+
+    def _restore(
+        self,
+        slug: str,
+        tag: t.Optional[set[str]],
+        meta: t.Optional[dict[str, str]],
+    ) -> None:
+        """Restore original state after the transaction rolled back"""
+        self._orig_slug = slug
+        self._orig_tag = tag
+        self._orig_meta = meta
 
     def delete(self) -> None:
         """Delete this post, cascade tags and metadatas, remove associated files"""
+        write_transaction(self._delete)
+
+    def _delete(self) -> None:
+        """Delete this post in a running transaction, may run more than once"""
         current_app.e('core:delete_post', {'post': self})
         current_app.db.execute(
             'DELETE FROM post WHERE slug=?',
             (self._orig_slug,)
         )
-        if os.path.isdir(current_app.instance_resource(self._orig_slug)):
-            shutil.rmtree(current_app.instance_resource(self._orig_slug))
-        current_app.db.commit()
+        _revise()
+        after_commit(functools.partial(_remove_files, self._orig_slug))
+
+
+def _revise() -> None:
+    """Count a change of posts in a running transaction"""
+    current_app.db.execute(
+        'UPDATE revision SET rev = rev + 1, changed = ?',
+        (int(time.time()),)
+    )
+
+
+def _move_files(old: str, new: str) -> None:
+    """Move upload dir of a post to its new slug"""
+    if os.path.isdir(current_app.instance_resource(old)):
+        os.rename(
+            current_app.instance_resource(old),
+            current_app.instance_resource(new)
+        )
+
+
+def _remove_files(slug: str) -> None:
+    """Remove upload dir of a post"""
+    if os.path.isdir(current_app.instance_resource(slug)):
+        shutil.rmtree(current_app.instance_resource(slug))
+
+
+def _is_busy(e: sqlite3.OperationalError) -> bool:
+    """Check if error is caused by another connection holding the lock"""
+    return str(e).startswith(('database is locked', 'database is busy'))
+
+
+def after_commit(action: t.Callable[[], None]) -> None:
+    """Defer action until running write transaction commits, or run it now"""
+    if 'after_commit' in g:
+        g.after_commit.append(action)
+    else:
+        action()
+
+
+def after_rollback(action: t.Callable[[], None]) -> None:
+    """Run action if running write transaction rolls back"""
+    if 'after_rollback' in g:
+        g.after_rollback.append(action)
+
+
+def _rollback() -> None:
+    """Roll back running write transaction and undo in-memory changes"""
+    current_app.db.rollback()
+    for action in reversed(g.after_rollback):
+        action()
+
+
+def write_transaction(work: t.Callable[[], None]) -> None:
+    """Run work in an immediate transaction, retry with backoff when locked"""
+    if 'after_commit' in g:
+        work()
+        return
+    retries = int(current_app.c.core.write_retries)
+    backoff = float(current_app.c.core.write_backoff)
+    if current_app.db.in_transaction:
+        current_app.db.commit()  # keep committing pending writes as before
+    # restore the timeout waited by other statements, 5 seconds by default
+    timeout = current_app.db.execute('PRAGMA busy_timeout').fetchone()[0]
+    try:
+        for attempt in range(retries + 1):
+            g.after_commit, g.after_rollback = [], []
+            # wait for the lock in SQLite as long as this attempt's backoff only
+            wait = backoff * 2**attempt
+            current_app.db.execute(f'PRAGMA busy_timeout = {int(wait * 1000)}')
+            try:
+                current_app.db.execute('BEGIN IMMEDIATE')
+                work()
+                current_app.db.commit()
+                break
+            except sqlite3.OperationalError as e:
+                _rollback()
+                if not _is_busy(e) or attempt == retries:
+                    raise
+                current_app.logger.info(f'database locked, retry #{attempt+1}')
+            except BaseException:
+                _rollback()
+                raise
+            finally:
+                actions = g.pop('after_commit')
+                g.pop('after_rollback')
+            time.sleep(random.uniform(0, wait))
+    finally:
+        current_app.db.execute(f'PRAGMA busy_timeout = {int(timeout)}')
+    for action in actions:
+        action()
 
 
 def get_post(slug: str, show_private: bool = False) -> t.Optional[Post]:
@@ -203,18 +346,15 @@ def get_post(slug: str, show_private: bool = False) -> t.Optional[Post]:
     return None
 
 
-def get_posts(
-    page: int,
-    page_size: int,
+def _cond_sql(
     tag: t.Optional[str] = None,
     indexed: t.Optional[bool] = None,
     public: t.Optional[bool] = None,
     provider: t.Optional[str] = None,
     like: t.Optional[str] = None,
-) -> tuple[list[Post], int]:
-    """Return a list of Post with filtering and pagination"""
+) -> tuple[str, dict[str, t.Any]]:
+    """Build the JOIN/WHERE part and parameters for filtering posts"""
     # pylint: disable=too-many-arguments
-    tag = current_app.e('core:get_posts', {'tag': tag}).get('tag', tag)
     if tag is not None:
         cond_sql = ' JOIN tag ON post.slug = tag.post WHERE tag.tag = :tag'
     else:
@@ -228,17 +368,101 @@ def get_posts(
     if like is not None:
         like = '%'.join(['']+like.split()+[''])
         cond_sql += ' AND (slug LIKE :like OR title LIKE :like)'
+    return cond_sql, {
+        'tag': tag,
+        'indexed': indexed,
+        'public': public,
+        'provider': provider,
+        'like': like,
+    }
+
+
+def get_posts(
+    page: int,
+    page_size: int,
+    tag: t.Optional[str] = None,
+    indexed: t.Optional[bool] = None,
+    public: t.Optional[bool] = None,
+    provider: t.Optional[str] = None,
+    like: t.Optional[str] = None,
+) -> tuple[list[Post], int]:
+    """Return a list of Post with filtering and pagination"""
+    # pylint: disable=too-many-arguments
+    tag = current_app.e('core:get_posts', {'tag': tag}).get('tag', tag)
+    cond_sql, params = _cond_sql(tag, indexed, public, provider, like)
     limit_sql = ' ORDER BY creation DESC'
     limit_sql += f' LIMIT {page_size} OFFSET {(page-1)*page_size}'
     select_cur = current_app.db.execute(
         'SELECT post.* FROM post'+cond_sql+limit_sql,
-        locals()
+        params
     )
     count_cur = current_app.db.execute(
         'SELECT COUNT(*) FROM post'+cond_sql,
-        locals()
+        params
     )
     return (
         [Post(**dict(row)) for row in select_cur],  # posts
         math.ceil(int(count_cur.fetchone()[0]) / page_size),  # total pages
     )
+
+
+def iter_posts(
+    columns: t.Sequence[str],
+    limit: int = -1,
+    offset: int = 0,
+    newest_first: bool = True,
+    indexed: t.Optional[bool] = None,
+    public: t.Optional[bool] = None,
+) -> t.Iterator[sqlite3.Row]:
+    """Yield rows of selected columns from cursor without building Post"""
+    # pylint: disable=too-many-arguments
+    for col in columns:
+        if col not in POST_COLUMNS:
+            raise ValueError(f'unknown post column `{col}`')
+    cond_sql, params = _cond_sql(indexed=indexed, public=public)
+    order = 'DESC' if newest_first else 'ASC'
+    yield from current_app.db.execute(
+        f'SELECT {", ".join(columns)} FROM post' + cond_sql
+        + f' ORDER BY creation {order}, slug {order}'
+        + f' LIMIT {int(limit)} OFFSET {int(offset)}',
+        params
+    )
+
+
+def stat_posts(
+    indexed: t.Optional[bool] = None,
+    public: t.Optional[bool] = None,
+) -> tuple[int, int]:
+    """Return count and newest modified time of all posts matching filter"""
+    cond_sql, params = _cond_sql(indexed=indexed, public=public)
+    row = current_app.db.execute(
+        'SELECT COUNT(*), IFNULL(MAX(modified), 0) FROM post' + cond_sql,
+        params
+    ).fetchone()
+    return int(row[0]), int(row[1])
+
+
+def stat_post_chunks(
+    size: int,
+    newest_first: bool = True,
+    indexed: t.Optional[bool] = None,
+    public: t.Optional[bool] = None,
+) -> list[tuple[int, int]]:
+    """Return count and newest modified time of each chunk iter_posts yields"""
+    cond_sql, params = _cond_sql(indexed=indexed, public=public)
+    order = 'DESC' if newest_first else 'ASC'
+    cur = current_app.db.execute(
+        f'SELECT (n-1) / {int(size)} AS chunk, COUNT(*), MAX(modified) FROM ('
+        + 'SELECT modified, ROW_NUMBER() OVER'
+        + f' (ORDER BY creation {order}, slug {order}) AS n'
+        + ' FROM post' + cond_sql
+        + ') GROUP BY chunk ORDER BY chunk',
+        params
+    )
+    return [(int(row[1]), int(row[2])) for row in cur]
+
+
+def get_revision() -> tuple[int, int]:
+    """Return count and last time of changes to posts, including removals"""
+    row = current_app.db.execute('SELECT rev, changed FROM revision').fetchone()
+    return int(row[0]), int(row[1])
@@ -0,0 +1,290 @@
+"""
+This module maintains a precomputed index of related posts.
+
+Posts are scored by the overlap of their tags, each tag weighted down by how
+common it is, and decayed by the distance between their creation times. Only
+public indexed posts are candidates. The top ones for every post are stored in
+the `related` table, so that rendering related posts costs only one query.
+
+On changes, only pairs involving the changed post are updated, and lists it
+leaves are refilled. Tag weights of other pairs drift until the next rebuild by
+`flask --app whisper.core rebuild-related`.
+"""
+import math
+import heapq
+import functools
+
+from . import current_app
+from .eventmgr import AnyDict
+from .post import Post, write_transaction
+
+__all__ = ['init_related', 'rebuild_related']
+
+Scores = dict[str, float]
+
+
+def _weight(df: int) -> float:
+    """Weight of a tag shared by `df` posts, the rarer the heavier"""
+    return 1 / math.log2(1 + df)
+
+
+def _rank(scores: Scores) -> list[tuple[float, str]]:
+    """Return top scores in descending order"""
+    return heapq.nlargest(
+        int(current_app.c.core.related_size),
+        ((score, other) for other, score in scores.items())
+    )
+
+
+def _score(
+    slug: str,
+    tags: set[str],
+    creation: int,
+    tagged: dict[str, dict[str, int]],
+) -> Scores:
+    """Score candidates, tagged maps tags to creation of visible posts"""
+    half_life = float(current_app.c.core.related_half_life)
+    scores: Scores = {}
+    creations: dict[str, int] = {}
+    for tag in tags:
+        others = tagged.get(tag, {})
+        weight = _weight(len(others) + (slug not in others))
+        for other in others:
+            scores[other] = scores.get(other, 0) + weight
+        creations.update(others)
+    scores.pop(slug, None)
+    # decay by creation time gap between two posts
+    return {
+        other: score * 0.5 ** (abs(creation - creations[other]) / half_life)
+        for other, score in scores.items()
+    }
+
+
+def _tagged(tags: set[str], exclude: str) -> dict[str, dict[str, int]]:
+    """Map tags to creation of visible posts with them, except the excluded"""
+    tagged: dict[str, dict[str, int]] = {}
+    if not tags:
+        return tagged
+    for row in current_app.db.execute(
+        'SELECT tag.post, tag.tag, post.creation FROM tag'
+        ' JOIN post ON post.slug = tag.post'
+        f' WHERE tag.tag IN ({",".join("?" * len(tags))}) AND tag.post != ?'
+        ' AND post.public = 1 AND post.indexed = 1',
+        [*tags, exclude]
+    ):
+        tagged.setdefault(row[1], {})[row[0]] = row[2]
+    return tagged
+
+
+def _refill(slug: str, exclude: str) -> None:
+    """Recompute the list of a post that lost an entry"""
+    creation = current_app.db.execute(
+        'SELECT creation FROM post WHERE slug=?', (slug,)
+    ).fetchone()[0]
+    tags = {
+        row[0] for row in
+        current_app.db.execute('SELECT tag FROM tag WHERE post=?', (slug,))
+    }
+    scores = _score(slug, tags, creation, _tagged(tags, exclude))
+    current_app.db.execute('DELETE FROM related WHERE post=?', (slug,))
+    current_app.db.executemany(
+        'INSERT INTO related (post, related, score) VALUES (?,?,?)',
+        [(slug, other, score) for score, other in _rank(scores)]
+    )
+
+
+def _enter(
+    slug: str,
+    tags: set[str],
+    creation: int,
+    scores: Scores,
+    tagged: dict[str, dict[str, int]],
+) -> None:
+    """Add visible post to lists it enters, evicting their lowest when full"""
+    size = int(current_app.c.core.related_size)
+    half_life = float(current_app.c.core.related_half_life)
+    marks = ','.join('?' * len(tags))
+    lists = {
+        row[0]: (row[1], row[2])
+        for row in current_app.db.execute(
+            'SELECT post, COUNT(*), MIN(score) FROM related'
+            f' WHERE post IN (SELECT post FROM tag WHERE tag IN ({marks}))'
+            ' GROUP BY post',
+            list(tags)
+        )
+    }
+    # hidden posts have lists too, counting themselves in tag weights
+    hidden: dict[str, tuple[int, float]] = {}
+    for other, tag, ctime in current_app.db.execute(
+        'SELECT tag.post, tag.tag, post.creation FROM tag'
+        ' JOIN post ON post.slug = tag.post'
+        f' WHERE tag.tag IN ({marks}) AND tag.post != ?'
+        ' AND NOT (post.public = 1 AND post.indexed = 1)',
+        [*tags, slug]
+    ):
+        weight = _weight(len(tagged.get(tag, {})) + 2)
+        hidden[other] = (ctime, hidden.get(other, (0, 0.0))[1] + weight)
+    scores = scores | {
+        other: weight * 0.5 ** (abs(creation - ctime) / half_life)
+        for other, (ctime, weight) in hidden.items()
+    }
+    enter = [
+        (other, score) for other, score in scores.items()
+        if lists.get(other, (0, 0.0))[0] < size
+        or score > lists[other][1]
+    ]
+    current_app.db.executemany(
+        'INSERT INTO related (post, related, score) VALUES (?,?,?)',
+        [(other, slug, score) for other, score in enter]
+    )
+    current_app.db.executemany(
+        'DELETE FROM related WHERE rowid = (SELECT rowid FROM related'
+        ' WHERE post=? ORDER BY score, related LIMIT 1)',
+        [
+            (other,) for other, _ in enter
+            if lists.get(other, (0, 0.0))[0] >= size
+        ]
+    )
+
+
+def _update(slug: str, tags: set[str], creation: int, visible: bool) -> None:
+    """Replace pairs involving a post in a running transaction"""
+    shrunk = [
+        row[0] for row in current_app.db.execute(
+            'SELECT post FROM related WHERE related=?', (slug,)
+        )
+    ]
+    current_app.db.execute(
+        'DELETE FROM related WHERE post=? OR related=?',
+        (slug, slug)
+    )
+    # refill lists the post was in, it competes again below if still visible
+    for other in shrunk:
+        _refill(other, slug)
+    tagged = _tagged(tags, slug)
+    scores = _score(slug, tags, creation, tagged)
+    current_app.db.executemany(
+        'INSERT INTO related (post, related, score) VALUES (?,?,?)',
+        [(slug, other, score) for score, other in _rank(scores)]
+    )
+    if visible and tags:
+        _enter(slug, tags, creation, scores, tagged)
+
+
+def _update_post(post: Post) -> None:
+    """Replace pairs involving a post being saved"""
+    # pylint: disable=protected-access
+    _update(
+        post._orig_slug,
+        set(post.tag),
+        post.creation,
+        post.public and post.indexed,
+    )
+
+
+def _on_save_post(arg: AnyDict) -> AnyDict:
+    """Update index once when visibility, creation time or tags change"""
+    # pylint: disable=protected-access
+    post = arg['post']
+    row = current_app.db.execute(
+        'SELECT public, indexed, creation FROM post WHERE slug=?',
+        (post._orig_slug,)
+    ).fetchone()
+    if (
+        post._tag is not None and post._tag != post._orig_tag
+        or row and tuple(row) != (post.public, post.indexed, post.creation)
+    ):
+        _update_post(post)
+    return arg
+
+
+def _on_delete_post(arg: AnyDict) -> AnyDict:
+    """Remove pairs involving post to be deleted, refill lists it leaves"""
+    # pylint: disable=protected-access
+    _update(arg['post']._orig_slug, set(), 0, False)
+    return arg
+
+
+def _on_change_post_slug(arg: AnyDict) -> AnyDict:
+    """Rename slug in index, scores don't depend on it"""
+    # pylint: disable=protected-access
+    post = arg['post']
+    for col in ('post', 'related'):
+        current_app.db.execute(
+            f'UPDATE related SET {col}=? WHERE {col}=?',
+            (post.slug, post._orig_slug)
+        )
+    return arg
+
+
+def _build() -> list[tuple[str, str, float]]:
+    """Compute rows of the whole related posts index from one snapshot"""
+    tags: dict[str, set[str]] = {}
+    creation: dict[str, int] = {}
+    tagged: dict[str, dict[str, int]] = {}
+    for post, tag, ctime, visible in current_app.db.execute(
+        'SELECT tag.post, tag.tag, post.creation,'
+        ' post.public = 1 AND post.indexed = 1 FROM tag'
+        ' JOIN post ON post.slug = tag.post'
+    ):
+        tags.setdefault(post, set()).add(tag)
+        creation[post] = ctime
+        if visible:
+            tagged.setdefault(tag, {})[post] = ctime
+    rows = []
+    for post, post_tags in tags.items():
+        scores = _score(post, post_tags, creation[post], tagged)
+        rows += [(post, other, score) for score, other in _rank(scores)]
+    return rows
+
+
+def _replace(rows: list[tuple[str, str, float]]) -> None:
+    """Replace the whole index with rows in a running transaction"""
+    current_app.db.execute('DELETE FROM related')
+    current_app.db.executemany(
+        'INSERT INTO related (post, related, score) VALUES (?,?,?)',
+        rows
+    )
+
+
+def rebuild_related() -> None:
+    """Recompute the whole related posts index"""
+    # scoring takes long on large sites, hold the write lock only to swap in
+    # lists of posts saved meanwhile may be stale until their next change
+    write_transaction(functools.partial(_replace, _build()))
+
+
+def _init() -> None:
+    """Create index table for databases of older versions"""
+    exists = current_app.db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='related'"
+    ).fetchone()
+    current_app.db.execute(
+        'CREATE TABLE IF NOT EXISTS related ('
+        ' post TEXT NOT NULL,'
+        ' related TEXT NOT NULL,'
+        ' score REAL NOT NULL,'
+        ' PRIMARY KEY (post, related) ON CONFLICT REPLACE'
+        ')'
+    )
+    current_app.db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_related ON related(related)'
+    )
+    current_app.db.execute(
+        'CREATE INDEX IF NOT EXISTS idx_related_score ON related(post, score)'
+    )
+    tagged = current_app.db.execute('SELECT 1 FROM tag LIMIT 1').fetchone()
+    if not exists and tagged:
+        current_app.logger.warning(
+            'related posts index created empty! '
+            'run `flask --app whisper.core rebuild-related` to build it'
+        )
+
+
+def init_related() -> None:
+    """Create index table if not exists, register handlers and command"""
+    write_transaction(_init)
+    current_app.e.register('core:save_post', _on_save_post)
+    current_app.e.register('core:delete_post', _on_delete_post)
+    current_app.e.register('core:change_post_slug', _on_change_post_slug)
+    current_app.cli.command('rebuild-related')(rebuild_related)
@@ -23,16 +23,32 @@ CREATE TABLE meta (
   PRIMARY KEY (post, k) ON CONFLICT REPLACE
 );
 
+CREATE TABLE revision (
+  rev INTEGER NOT NULL,
+  changed INTEGER NOT NULL
+);
+
+CREATE TABLE related (
+  post TEXT NOT NULL,
+  related TEXT NOT NULL,
+  score REAL NOT NULL,
+  PRIMARY KEY (post, related) ON CONFLICT REPLACE
+);
+
 CREATE INDEX idx_provide ON post(provide);
 CREATE INDEX idx_public ON post(public);
 CREATE INDEX idx_indexed ON post(indexed);
 CREATE INDEX idx_creation ON post(creation DESC);
 CREATE INDEX idx_modified ON post(modified DESC);
+CREATE INDEX idx_listing ON post(public, indexed, creation, slug, modified);
 CREATE INDEX idx_tag ON tag(tag);
 CREATE INDEX idx_post_tag ON tag(post);
 CREATE INDEX idx_meat ON meta(k);
 CREATE INDEX idx_post_meat ON meta(post);
+CREATE INDEX idx_related ON related(related);
+CREATE INDEX idx_related_score ON related(post, score);
 
 INSERT INTO post (slug, public, indexed, title, excerpt, content) VALUES ('hello-world', 1, 1, 'Hello, world!', 'Successfully installed Whisper.', 'Congratulations!\n\nYou have successfully installed the Whisper blog engine.\n\nPlease head to [Getting Started](https://ciel.dev/whisper-getting-started/) for a glance of features.\n');
 INSERT INTO tag (post, tag) VALUES ('hello-world', 'hello');
 INSERT INTO meta (post, k, v) VALUES ('hello-world', 'hello', 'world');
+INSERT INTO revision (rev, changed) VALUES (0, strftime('%s'));